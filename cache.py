@@ -0,0 +1,39 @@
+"""
+In-process TTL + LRU cache for upstream API results
+"""
+
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import time
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire after ttl seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, age: float = 0):
+        """Store value; age (seconds) counts against the ttl, e.g. for entries loaded from disk"""
+        self._data[key] = (time.monotonic() - age, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,83 @@
+"""
+Bounded pool of sqlite3 connections for the read endpoints
+
+Connections are opened lazily up to `size` and reused, so each request keeps
+a warm page cache and the statement cache instead of reconnecting.
+"""
+
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import queue
+import sqlite3
+import threading
+
+# Applied to every new connection (read pool and the aiosqlite writer)
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+
+# Prepared statements kept per connection (sqlite3's default is 128)
+STATEMENT_CACHE_SIZE = 256
+
+def init_conn(conn: sqlite3.Connection):
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+
+class ConnectionPool:
+    """At most `size` sqlite3 connections; get() blocks while all are checked out"""
+
+    def __init__(self, path: str, size: int = 8):
+        self.path = path
+        self.size = size
+        self._idle: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=size)
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Handed between threadpool workers and the event loop, hence check_same_thread=False
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        init_conn(conn)
+        return conn
+
+    def get(self, timeout: Optional[float] = None) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except sqlite3.Error:
+                    self._opened -= 1
+                    raise
+        return self._idle.get(timeout=timeout)
+
+    def put(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection for the duration of the with block"""
+        conn = self.get()
+        try:
+            yield conn
+        finally:
+            self.put(conn)
+
+    def close(self):
+        """Close idle connections; call once no requests are in flight"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._opened = 0
@@ -0,0 +1,71 @@
+"""
+Per-host outbound HTTP clients
+
+Each upstream gets its own connection pool and timeouts so a slow OpenAI
+completion can't hold sockets that a sub-second ipinfo lookup needs.
+Transient failures are retried with jittered exponential backoff.
+"""
+
+from contextlib import nullcontext
+from typing import Dict, Optional
+import asyncio
+import random
+import httpx
+from limiters import SlidingWindow, parse_duration
+
+# host -> (max_keepalive_connections, read timeout in seconds)
+HOST_LIMITS = {
+    "openai": (10, 30.0),
+    "apollo": (20, 15.0),
+    "hunter": (20, 15.0),
+    "ipinfo": (50, 10.0),
+    "slack": (5, 5.0),
+}
+
+def build_http_clients() -> Dict[str, httpx.AsyncClient]:
+    """Create one pooled AsyncClient per upstream host"""
+    clients = {}
+    for host, (keepalive, read_timeout) in HOST_LIMITS.items():
+        clients[host] = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=keepalive * 2, max_keepalive_connections=keepalive),
+            timeout=httpx.Timeout(read_timeout, connect=2.0),
+            http2=True,
+        )
+    return clients
+
+async def close_http_clients(clients: Dict[str, httpx.AsyncClient]):
+    """Close every per-host client"""
+    for client in clients.values():
+        await client.aclose()
+
+# Retry policy for transient upstream failures (transport errors, 429, 5xx)
+RETRY_ATTEMPTS = 3
+RETRY_INITIAL = 0.5
+RETRY_MAX = 8.0
+RETRY_AFTER_MAX = 60.0
+
+def is_retryable(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+def backoff_delay(attempt: int, retry_after: str = "") -> float:
+    """Honor Retry-After when given, else exponential backoff plus up to 1s of jitter"""
+    if retry_after:
+        return min(parse_duration(retry_after), RETRY_AFTER_MAX)
+    return min(RETRY_INITIAL * 2 ** attempt + random.uniform(0, 1), RETRY_MAX)
+
+async def request_with_retry(client: httpx.AsyncClient, method: str, url: str,
+                             limiter: Optional[SlidingWindow] = None, **kwargs) -> httpx.Response:
+    """client.request() with retries; each attempt takes its own rate-limit slot"""
+    for attempt in range(RETRY_ATTEMPTS):
+        last_attempt = attempt == RETRY_ATTEMPTS - 1
+        try:
+            async with limiter.slot() if limiter else nullcontext():
+                response = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if last_attempt:
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        if last_attempt or not is_retryable(response.status_code):
+            return response
+        await asyncio.sleep(backoff_delay(attempt, response.headers.get("retry-after", "")))
@@ -0,0 +1,144 @@
+"""
+Client-side concurrency control for upstream APIs
+"""
+
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+import asyncio
+import re
+import time
+
+# OpenAI reset headers look like "1s", "6m0s", "250ms"
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_duration(value: str) -> float:
+    """Parse a Retry-After / x-ratelimit-reset-* value into seconds"""
+    if not value:
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        return sum(float(n) * _UNIT_SECONDS[unit] for n, unit in _DURATION_RE.findall(value))
+
+class AIMDLimiter:
+    """Additive-increase / multiplicative-decrease concurrency limit.
+
+    Every healthy completion (no error, latency under target) grows the
+    limit by alpha/c, i.e. about alpha per full window of requests.
+    A 429/5xx or transport failure multiplies it by beta.
+    """
+
+    def __init__(self, c: float = 4.0, alpha: float = 0.5, beta: float = 0.5,
+                 target_latency: float = 4.0, min_c: float = 1.0, max_c: float = 32.0):
+        self.c = c
+        self.alpha = alpha
+        self.beta = beta
+        self.target_latency = target_latency
+        self.min_c = min_c
+        self.max_c = max_c
+        self.in_flight = 0
+        self._resume_at = 0.0
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one unit of concurrency, waiting while at the limit or paused"""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.c))
+            self.in_flight += 1
+        try:
+            delay = self._resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self, elapsed: float):
+        if elapsed <= self.target_latency:
+            self.c = min(self.max_c, self.c + self.alpha / self.c)
+
+    def on_error(self, status: Optional[int] = None):
+        """Back off on throttling, server errors and transport failures (status None)"""
+        if status is None or status == 429 or status >= 500:
+            self.c = max(self.min_c, self.c * self.beta)
+
+    def pause(self, seconds: float):
+        """Hold new slots until the given number of seconds has passed"""
+        if seconds > 0:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    def on_headers(self, headers):
+        """Pre-pause from Retry-After or an exhausted x-ratelimit-remaining-requests"""
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            self.pause(parse_duration(retry_after))
+        elif headers.get("x-ratelimit-remaining-requests") == "0":
+            self.pause(parse_duration(headers.get("x-ratelimit-reset-requests", "1s")))
+
+class SlidingWindow:
+    """Requests-per-minute / tokens-per-minute limit over a sliding 60s window.
+
+    Callers block before dispatch instead of spending a round trip on a 429.
+    """
+
+    def __init__(self, rpm: int, tpm: Optional[int] = None, window: float = 60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self.events = deque()  # (timestamp, tokens)
+        self.tokens = 0
+        self._lock = asyncio.Lock()
+
+    def _expire(self, now: float):
+        while self.events and now - self.events[0][0] >= self.window:
+            _, tokens = self.events.popleft()
+            self.tokens -= tokens
+
+    async def wait_if_throttled(self, est_tokens: int = 0):
+        """Sleep until the window has room, then record this request"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                full = len(self.events) >= self.rpm or (
+                    self.tpm is not None and self.events and self.tokens + est_tokens > self.tpm
+                )
+                if not full:
+                    break
+                await asyncio.sleep(self.window - (now - self.events[0][0]))
+            self.events.append((now, est_tokens))
+            self.tokens += est_tokens
+
+    @asynccontextmanager
+    async def slot(self, est_tokens: int = 0):
+        await self.wait_if_throttled(est_tokens)
+        yield
+
+    def reconcile(self, headers):
+        """Pad the window so it never reports more headroom than the provider does"""
+        now = time.monotonic()
+        remaining = headers.get("x-ratelimit-remaining-requests", "")
+        if remaining.isdigit():
+            for _ in range(self.rpm - int(remaining) - len(self.events)):
+                self.events.append((now, 0))
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens", "")
+        if self.tpm is not None and remaining_tokens.isdigit():
+            missing = self.tpm - int(remaining_tokens) - self.tokens
+            if missing > 0:
+                self.events.append((now, missing))
+                self.tokens += missing
+
+def build_rate_limiters() -> Dict[str, SlidingWindow]:
+    """One sliding window per upstream, sized to the providers' published limits"""
+    return {
+        "openai": SlidingWindow(rpm=500, tpm=200_000),
+        "apollo": SlidingWindow(rpm=200),
+        "hunter": SlidingWindow(rpm=300),
+        "ipinfo": SlidingWindow(rpm=1000),
+        "slack": SlidingWindow(rpm=60),
+    }
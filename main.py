@@ -3,19 +3,58 @@ Swan AI Clone - Production Backend with RB2B Integration
 Deploy to Railway.app
 """
 
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Request, HTTPException, BackgroundTasks, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from fastapi.responses import JSONResponse, RedirectResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Callable, Tuple
 import httpx
-import json
+import aiosqlite
+import orjson
+import msgpack
 import sqlite3
 import os
 from datetime import datetime
+from dataclasses import dataclass
+from functools import lru_cache, wraps
+from itertools import product
+from contextlib import asynccontextmanager
 import asyncio
+import base64
+import hashlib
+import secrets
+import re
+import time
+from http_clients import (build_http_clients, close_http_clients, request_with_retry,
+                          backoff_delay, is_retryable, RETRY_ATTEMPTS)
+from limiters import AIMDLimiter, build_rate_limiters
+from cache import TTLCache
+from db_pool import ConnectionPool, CONNECTION_PRAGMAS
 
-app = FastAPI(title="Swan AI Clone API", version="2.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Init DB, per-host HTTP clients and the batched DB writer for the app lifetime"""
+    init_db()
+    app.state.db = await connect_db()
+    app.state.read_pool = ConnectionPool(DB_PATH, size=READ_POOL_SIZE)
+    app.state.http = build_http_clients()
+    app.state.db_queue = asyncio.Queue()
+    app.state.db_writer = asyncio.create_task(db_writer(app.state.db_queue, app.state.db))
+    yield
+    await flush_all_sessions()
+    await app.state.db_queue.put(None)
+    await app.state.db_writer
+    await app.state.db.close()
+    app.state.read_pool.close()
+    await close_http_clients(app.state.http)
+
+class ORJSONResponse(JSONResponse):
+    """JSON responses serialized with orjson (FastAPI's own ORJSONResponse is deprecated)"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+app = FastAPI(title="Swan AI Clone API", version="2.1.0", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # CORS - Allow all origins for tracking
 app.add_middleware(
@@ -26,25 +65,46 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def to_json(value: Any) -> str:
+    """Serialize to JSON text for TEXT columns and prompts"""
+    return orjson.dumps(value).decode()
+
+def to_msgpack(value: Any) -> bytes:
+    """Serialize for the lead's structured BLOB columns (see LEAD_PACKED_COLUMNS)"""
+    return msgpack.packb(value)
+
 # Database path
 DB_PATH = os.getenv("DB_PATH", "swan.db")
+READ_POOL_SIZE = 8
 
-# API Keys from environment variables
-def get_settings():
-    return {
-        "apollo_api_key": os.getenv("APOLLO_API_KEY", ""),
-        "hunter_api_key": os.getenv("HUNTER_API_KEY", ""),
-        "openai_api_key": os.getenv("OPENAI_API_KEY", ""),
-        "ipinfo_token": os.getenv("IPINFO_TOKEN", ""),
-        "slack_webhook_url": os.getenv("SLACK_WEBHOOK_URL", ""),
-        "icp_config": {
-            "industries": ["SaaS", "Technology", "E-commerce", "Software", "Marketing", "Digital Agency"],
-            "min_employees": 10,
-            "max_employees": 5000,
-            "countries": ["United States", "United Kingdom", "Canada", "India", "Australia", "Germany"],
-            "target_titles": ["CEO", "CTO", "VP", "Director", "Head of", "Manager", "Founder"]
-        }
-    }
+@dataclass(frozen=True)
+class ICPConfig:
+    industries: Tuple[str, ...] = ("SaaS", "Technology", "E-commerce", "Software", "Marketing", "Digital Agency")
+    min_employees: int = 10
+    max_employees: int = 5000
+    countries: Tuple[str, ...] = ("United States", "United Kingdom", "Canada", "India", "Australia", "Germany")
+    target_titles: Tuple[str, ...] = ("CEO", "CTO", "VP", "Director", "Head of", "Manager", "Founder")
+
+@dataclass(frozen=True)
+class Settings:
+    apollo_api_key: str
+    hunter_api_key: str
+    openai_api_key: str
+    ipinfo_token: str
+    slack_webhook_url: str
+    icp_config: ICPConfig
+
+# API Keys from environment variables, read once per process; restart to pick up changes
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings(
+        apollo_api_key=os.getenv("APOLLO_API_KEY", ""),
+        hunter_api_key=os.getenv("HUNTER_API_KEY", ""),
+        openai_api_key=os.getenv("OPENAI_API_KEY", ""),
+        ipinfo_token=os.getenv("IPINFO_TOKEN", ""),
+        slack_webhook_url=os.getenv("SLACK_WEBHOOK_URL", ""),
+        icp_config=ICPConfig(),
+    )
 
 # ============== MODELS ==============
 
@@ -55,7 +115,7 @@ class VisitorData(BaseModel):
     current_url: str
     referrer: Optional[str] = ""
     pages_viewed: List[Dict[str, Any]] = []
-    visit_duration: int = 0
+    visit_duration: int = Field(0, ge=0, le=2**31)  # seconds; bounded so it fits a SQLite INTEGER
     user_agent: Optional[str] = ""
     screen_size: Optional[str] = ""
     timestamp: str
@@ -63,6 +123,13 @@ class VisitorData(BaseModel):
 
 # ============== DATABASE ==============
 
+async def connect_db() -> aiosqlite.Connection:
+    """Open the long-lived write connection (runs on aiosqlite's own thread), tuned for WAL and cheap commits"""
+    db = await aiosqlite.connect(DB_PATH)
+    for pragma in CONNECTION_PRAGMAS:
+        await db.execute(pragma)
+    return db
+
 def init_db():
     """Initialize SQLite database"""
     conn = sqlite3.connect(DB_PATH)
@@ -123,16 +190,16 @@ def init_db():
             session_id TEXT,
             ip_address TEXT,
             identified_company TEXT,
-            pages_viewed TEXT,
+            pages_viewed BLOB,
             visit_duration INTEGER DEFAULT 0,
             referrer TEXT,
             icp_score INTEGER DEFAULT 0,
             tier TEXT DEFAULT 'cold',
-            match_reasons TEXT,
-            intent_signals TEXT,
+            match_reasons BLOB,
+            intent_signals BLOB,
             research_summary TEXT,
-            talking_points TEXT,
-            email_draft TEXT,
+            talking_points BLOB,
+            email_draft BLOB,
             recommended_action TEXT,
             urgency TEXT DEFAULT 'low',
             status TEXT DEFAULT 'new',
@@ -146,6 +213,19 @@ def init_db():
         )
     """)
     
+    # Upstream results (Hunter contacts, OpenAI scores) keyed per kind; replaces score_cache
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS enrichment_cache (
+            kind TEXT,
+            key TEXT,
+            value BLOB,
+            created_at REAL,
+            PRIMARY KEY (kind, key)
+        )
+    """)
+    for kind, cache in ENRICHMENT_CACHES.items():
+        cursor.execute(SQL_PRUNE_ENRICHMENT, (kind, time.time() - cache.ttl))
+    
     # Add missing columns to existing database (for upgrades)
     try:
         cursor.execute("ALTER TABLE leads ADD COLUMN source TEXT DEFAULT 'tracking'")
@@ -168,160 +248,232 @@ def init_db():
     except:
         pass
     
+    # Indexes for hot lookups (companies.domain and leads.lead_id are already UNIQUE-indexed)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_session ON leads(session_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_tier_source ON leads(tier, source)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_contacts_company ON contacts(company_id)")
+    # Keyset pages (filters + ORDER BY created_at DESC, id DESC LIMIT) walk an index instead of sorting;
+    # id DESC (not the implicit ascending rowid suffix) keeps same-timestamp rows in page order
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_tier_created_id ON leads(tier, created_at DESC, id DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_source_created_id ON leads(source, created_at DESC, id DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_created_id ON leads(created_at DESC, id DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_visitors_created_id ON visitors(created_at DESC, id DESC)")
+    # Full ANALYZE only for a database that has never been analyzed; afterwards optimize
+    # re-analyzes just the tables whose size drifted (0x10002 checks every table, SQLite 3.46+)
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        cursor.execute("PRAGMA optimize=0x10002")
+    else:
+        cursor.execute("ANALYZE")
+    
     conn.commit()
     conn.close()
     print("✅ Database initialized")
 
 # ============== IP LOOKUP ==============
 
-async def lookup_company_from_ip(ip_address: str, token: str = "") -> Dict:
+# Domain guessing: drop separators, then trailing legal suffixes ("Acme Pvt. Ltd." -> "acme")
+_DOMAIN_DELETE = str.maketrans("", "", " ,.")
+_SUFFIX_RE = re.compile(r"(?:inc|llc|ltd|corp|corporation|pvt|private|limited)+$")
+
+# Per-upstream RPM/TPM windows; callers wait here rather than eat a 429
+rate_limiters = build_rate_limiters()
+
+# Successful upstream lookups only; failures are always retried on the next call
+ip_cache = TTLCache(maxsize=10_000, ttl=24 * 3600)
+apollo_cache = TTLCache(maxsize=10_000, ttl=24 * 3600)
+HUNTER_CACHE_TTL = 24 * 3600
+hunter_cache = TTLCache(maxsize=10_000, ttl=HUNTER_CACHE_TTL)
+
+async def lookup_company_from_ip(client: httpx.AsyncClient, ip_address: str, token: str = "") -> Dict:
     """Look up company from IP using IPinfo.io"""
     if not ip_address or ip_address in ["127.0.0.1", "localhost", "::1", ""]:
         return {"success": False, "error": "Local/missing IP"}
     
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            url = f"https://ipinfo.io/{ip_address}"
-            if token:
-                url += f"?token={token}"
+    cached = ip_cache.get(ip_address)
+    if cached is not None:
+        return cached
+    
+    try:
+        url = f"https://ipinfo.io/{ip_address}"
+        if token:
+            url += f"?token={token}"
+        
+        response = await request_with_retry(client, "GET", url, limiter=rate_limiters["ipinfo"])
+        
+        if response.status_code == 200:
+            data = orjson.loads(response.content)
+            org = data.get("org", "")
+            company_name = ""
+            
+            if org:
+                parts = org.split(" ", 1)
+                company_name = parts[1] if len(parts) > 1 else org
             
-            response = await client.get(url)
+            # Try to guess domain
+            domain = ""
+            if company_name:
+                clean = _SUFFIX_RE.sub("", company_name.lower().translate(_DOMAIN_DELETE))
+                if len(clean) > 2:
+                    domain = f"{clean[:20]}.com"
             
-            if response.status_code == 200:
-                data = response.json()
-                org = data.get("org", "")
-                company_name = ""
-                
-                if org:
-                    parts = org.split(" ", 1)
-                    company_name = parts[1] if len(parts) > 1 else org
-                
-                # Try to guess domain
-                domain = ""
-                if company_name:
-                    clean = company_name.lower().replace(" ", "").replace(",", "").replace(".", "")
-                    for suffix in ["inc", "llc", "ltd", "corp", "corporation", "pvt", "private", "limited"]:
-                        clean = clean.replace(suffix, "")
-                    if len(clean) > 2:
-                        domain = f"{clean[:20]}.com"
-                
-                return {
-                    "success": True,
-                    "data": {
-                        "ip": ip_address,
-                        "company_name": company_name,
-                        "domain": domain,
-                        "city": data.get("city", ""),
-                        "region": data.get("region", ""),
-                        "country": data.get("country", ""),
-                        "org": org
-                    }
+            result = {
+                "success": True,
+                "data": {
+                    "ip": ip_address,
+                    "company_name": company_name,
+                    "domain": domain,
+                    "city": data.get("city", ""),
+                    "region": data.get("region", ""),
+                    "country": data.get("country", ""),
+                    "org": org
                 }
-            return {"success": False, "error": f"Status {response.status_code}"}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+            }
+            ip_cache.set(ip_address, result)
+            return result
+        return {"success": False, "error": f"Status {response.status_code}"}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
 
 # ============== ENRICHMENT APIs ==============
 
-async def enrich_company_apollo(domain: str, api_key: str) -> Dict:
+async def enrich_company_apollo(client: httpx.AsyncClient, domain: str, api_key: str) -> Dict:
     """Enrich company using Apollo API"""
     if not api_key or not domain:
         return {"success": False, "error": "Missing API key or domain"}
     
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        try:
-            response = await client.post(
-                "https://api.apollo.io/v1/organizations/enrich",
-                headers={"Content-Type": "application/json", "Cache-Control": "no-cache"},
-                json={"api_key": api_key, "domain": domain}
-            )
+    cached = apollo_cache.get(domain)
+    if cached is not None:
+        return cached
+    
+    try:
+        response = await request_with_retry(
+            client, "POST", "https://api.apollo.io/v1/organizations/enrich",
+            limiter=rate_limiters["apollo"],
+            headers={"Content-Type": "application/json", "Cache-Control": "no-cache"},
+            content=orjson.dumps({"api_key": api_key, "domain": domain})
+        )
+        
+        if response.status_code == 200:
+            data = orjson.loads(response.content)
+            org = data.get("organization", {})
+            if not org:
+                return {"success": False, "error": "No data found"}
             
-            if response.status_code == 200:
-                data = response.json()
-                org = data.get("organization", {})
-                if not org:
-                    return {"success": False, "error": "No data found"}
-                
-                return {
-                    "success": True,
-                    "data": {
-                        "name": org.get("name", ""),
-                        "domain": org.get("primary_domain", domain),
-                        "industry": org.get("industry", "Unknown"),
-                        "employee_count": org.get("estimated_num_employees", 0),
-                        "country": org.get("country", ""),
-                        "city": org.get("city", ""),
-                        "description": org.get("short_description", ""),
-                        "funding_stage": org.get("latest_funding_stage", ""),
-                        "total_funding": org.get("total_funding", 0),
-                        "annual_revenue": org.get("annual_revenue", 0),
-                        "linkedin_url": org.get("linkedin_url", ""),
-                    }
+            result = {
+                "success": True,
+                "data": {
+                    "name": org.get("name", ""),
+                    "domain": org.get("primary_domain", domain),
+                    "industry": org.get("industry", "Unknown"),
+                    "employee_count": org.get("estimated_num_employees", 0),
+                    "country": org.get("country", ""),
+                    "city": org.get("city", ""),
+                    "description": org.get("short_description", ""),
+                    "funding_stage": org.get("latest_funding_stage", ""),
+                    "total_funding": org.get("total_funding", 0),
+                    "annual_revenue": org.get("annual_revenue", 0),
+                    "linkedin_url": org.get("linkedin_url", ""),
                 }
-            return {"success": False, "error": response.text}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+            }
+            apollo_cache.set(domain, result)
+            return result
+        return {"success": False, "error": response.text}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
 
-async def find_contacts_hunter(domain: str, api_key: str) -> Dict:
+async def find_contacts_hunter(client: httpx.AsyncClient, domain: str, api_key: str) -> Dict:
     """Find contacts using Hunter.io"""
     if not api_key or not domain:
         return {"success": False, "contacts": []}
     
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        try:
-            response = await client.get(
-                "https://api.hunter.io/v2/domain-search",
-                params={"domain": domain, "limit": 5, "api_key": api_key}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                emails = data.get("data", {}).get("emails", [])
-                contacts = [{
-                    "name": f"{e.get('first_name', '')} {e.get('last_name', '')}".strip(),
-                    "email": e.get("value", ""),
-                    "title": e.get("position", ""),
-                    "department": e.get("department", ""),
-                    "seniority": e.get("seniority", ""),
-                    "linkedin_url": e.get("linkedin", ""),
-                    "confidence": e.get("confidence", 0)
-                } for e in emails[:5]]
-                return {"success": True, "contacts": contacts}
-            return {"success": False, "contacts": []}
-        except Exception as e:
-            return {"success": False, "contacts": [], "error": str(e)}
-
-async def score_lead_openai(company: Dict, contacts: List, visit_data: Dict, person_data: Dict, api_key: str, icp_config: Dict) -> Dict:
-    """Score lead using OpenAI"""
-    if not api_key:
-        return {"success": False, "error": "No OpenAI key"}
-    
-    prompt = f"""You are a B2B lead scoring AI. Score this website visitor.
+    try:
+        cached = await get_enrichment("hunter", domain)
+        if cached is not None:
+            return orjson.loads(cached)
+        
+        response = await request_with_retry(
+            client, "GET", "https://api.hunter.io/v2/domain-search",
+            limiter=rate_limiters["hunter"],
+            params={"domain": domain, "limit": 5, "api_key": api_key}
+        )
+        
+        if response.status_code == 200:
+            data = orjson.loads(response.content)
+            emails = data.get("data", {}).get("emails", [])
+            contacts = [{
+                "name": f"{e.get('first_name', '')} {e.get('last_name', '')}".strip(),
+                "email": e.get("value", ""),
+                "title": e.get("position", ""),
+                "department": e.get("department", ""),
+                "seniority": e.get("seniority", ""),
+                "linkedin_url": e.get("linkedin", ""),
+                "confidence": e.get("confidence", 0)
+            } for e in emails[:5]]
+            result = {"success": True, "contacts": contacts}
+            await put_enrichment("hunter", domain, orjson.dumps(result))
+            return result
+        return {"success": False, "contacts": []}
+    except Exception as e:
+        return {"success": False, "contacts": [], "error": str(e)}
 
-ICP CRITERIA:
-- Industries: {', '.join(icp_config.get('industries', []))}
-- Company Size: {icp_config.get('min_employees', 10)} - {icp_config.get('max_employees', 5000)} employees
-- Countries: {', '.join(icp_config.get('countries', []))}
-- Target Titles: {', '.join(icp_config.get('target_titles', []))}
+# Shared across all scoring calls so bursts adapt to OpenAI's real capacity
+openai_limiter = AIMDLimiter()
 
-VISITOR'S COMPANY:
-- Name: {company.get('name', 'Unknown')}
-- Industry: {company.get('industry', 'Unknown')}
-- Employees: {company.get('employee_count', 0)}
-- Country: {company.get('country', 'Unknown')}
-- Description: {company.get('description', '')[:200]}
+# Scoring results by input fingerprint
+SCORE_CACHE_TTL = 6 * 3600
+score_cache = TTLCache(maxsize=5_000, ttl=SCORE_CACHE_TTL)
 
-PERSON (if identified):
-- Name: {person_data.get('name', 'Unknown')}
-- Title: {person_data.get('title', 'Unknown')}
-- Email: {person_data.get('email', 'Unknown')}
+# Hunter contacts and scores are also persisted in the enrichment_cache table so they
+# survive restarts; each kind's in-memory TTLCache sits in front and sets its TTL.
+# Values are orjson bytes, so every caller decodes a fresh dict it may mutate.
+ENRICHMENT_CACHES = {"hunter": hunter_cache, "score": score_cache}
 
-BEHAVIOR ON SITE:
-- Pages: {json.dumps([p.get('url', p) if isinstance(p, dict) else p for p in visit_data.get('pages_viewed', [])])}
-- Duration: {visit_data.get('visit_duration', 0)} seconds
-- Referrer: {visit_data.get('referrer', 'Direct')}
+def _sync_get_enrichment(pool: ConnectionPool, kind: str, key: str, since: float) -> Optional[tuple]:
+    with pool.connection() as conn:
+        row = conn.execute(SQL_SELECT_ENRICHMENT, (kind, key, since)).fetchone()
+    return tuple(row) if row else None
+
+async def get_enrichment(kind: str, key: str) -> Optional[bytes]:
+    """Memory first, then the table through a read-pool connection (not the single writer)"""
+    memory = ENRICHMENT_CACHES[kind]
+    value = memory.get(key)
+    if value is None:
+        now = time.time()
+        row = await asyncio.to_thread(_sync_get_enrichment, app.state.read_pool, kind, key, now - memory.ttl)
+        if row is not None:
+            value, created_at = row
+            # Age the entry by the row's age so memory only keeps it for the TTL it has left
+            memory.set(key, value, age=now - created_at)
+    return value
+
+async def put_enrichment(kind: str, key: str, value: bytes):
+    ENRICHMENT_CACHES[kind].set(key, value)
+    await app.state.db_queue.put(("enrichment_cache", (kind, key, value, time.time())))
+
+def score_cache_key(company: Dict, contacts: List, visit_data: Dict, person_data: Dict, icp_config: ICPConfig) -> str:
+    """Fingerprint the inputs that drive the score; near-identical visits share a key"""
+    pages = sorted(str(p.get("url", p) if isinstance(p, dict) else p) for p in visit_data.get("pages_viewed", []))
+    duration = visit_data.get("visit_duration", 0) or 0
+    duration_bucket = 2 if duration > 180 else 1 if duration > 60 else 0
+    # person email/title are included because the summary and email draft are personalised
+    parts = (company.get("domain"), company.get("name"), company.get("industry"), company.get("employee_count"),
+             company.get("country"), tuple(pages), duration_bucket, len(contacts),
+             person_data.get("email", ""), person_data.get("title", ""), orjson.dumps(icp_config, option=orjson.OPT_SORT_KEYS))
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+@lru_cache(maxsize=8)
+def scoring_system_prompt(icp_config: ICPConfig) -> str:
+    """Static part of the scoring prompt (ICP, rubric, output schema), rendered once per ICP.
 
-CONTACTS FOUND: {len(contacts)}
+    Kept byte-identical across calls and sent first so OpenAI's prompt cache can reuse it.
+    """
+    return f"""You are a B2B lead scoring AI. Score this website visitor. Respond with valid JSON only.
+
+ICP CRITERIA:
+- Industries: {', '.join(icp_config.industries)}
+- Company Size: {icp_config.min_employees} - {icp_config.max_employees} employees
+- Countries: {', '.join(icp_config.countries)}
+- Target Titles: {', '.join(icp_config.target_titles)}
 
 SCORING:
 - Person identified with email = +25 points
@@ -346,71 +498,232 @@ OUTPUT JSON ONLY (no markdown):
   "email_draft": {{"subject": "...", "body": "3-4 sentences"}}
 }}"""
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"},
-                json={
-                    "model": "gpt-4o-mini",
-                    "messages": [
-                        {"role": "system", "content": "You are a B2B lead scoring AI. Respond with valid JSON only."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "temperature": 0.3,
-                    "max_tokens": 1000
-                }
-            )
+# Pulled out of the partial streamed JSON so hot leads can alert before the completion ends
+_TIER_RE = re.compile(r'"tier"\s*:\s*"(hot|warm|cold)"')
+_SCORE_RE = re.compile(r'"icp_score"\s*:\s*(\d+)')
+
+async def score_lead_openai(client: httpx.AsyncClient, company: Dict, contacts: List, visit_data: Dict, person_data: Dict, api_key: str, icp_config: ICPConfig,
+                            on_tier: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Score lead using OpenAI (streamed); on_tier gets {"icp_score", "tier"} as soon as the tier is known
+
+    If the stream breaks or the final JSON is invalid after on_tier fired, the streamed
+    {"icp_score", "tier"} is returned with "partial": True, so the saved lead matches the alert.
+    """
+    if not api_key:
+        return {"success": False, "error": "No OpenAI key"}
+    
+    streamed: Optional[Dict] = None
+    try:
+        cache_key = score_cache_key(company, contacts, visit_data, person_data, icp_config)
+        cached = await get_enrichment("score", cache_key)
+        if cached is not None:
+            data = orjson.loads(cached)
+            if on_tier:
+                on_tier({"icp_score": data.get("icp_score", 0), "tier": data.get("tier")})
+            return {"success": True, "data": data}
+        
+        system_prompt = scoring_system_prompt(icp_config)
+        prompt = f"""VISITOR'S COMPANY:
+- Name: {company.get('name', 'Unknown')}
+- Industry: {company.get('industry', 'Unknown')}
+- Employees: {company.get('employee_count', 0)}
+- Country: {company.get('country', 'Unknown')}
+- Description: {company.get('description', '')[:200]}
+
+PERSON (if identified):
+- Name: {person_data.get('name', 'Unknown')}
+- Title: {person_data.get('title', 'Unknown')}
+- Email: {person_data.get('email', 'Unknown')}
+
+BEHAVIOR ON SITE:
+- Pages: {to_json([p.get('url', p) if isinstance(p, dict) else p for p in visit_data.get('pages_viewed', [])])}
+- Duration: {visit_data.get('visit_duration', 0)} seconds
+- Referrer: {visit_data.get('referrer', 'Direct')}
+
+CONTACTS FOUND: {len(contacts)}"""
+
+        for attempt in range(RETRY_ATTEMPTS):
+            transport_failed = False
+            async with rate_limiters["openai"].slot(est_tokens=(len(system_prompt) + len(prompt)) // 4), openai_limiter.slot():
+                started = time.monotonic()
+                content = ""
+                try:
+                    async with client.stream(
+                        "POST",
+                        "https://api.openai.com/v1/chat/completions",
+                        headers={"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"},
+                        content=orjson.dumps({
+                            "model": "gpt-4o-mini",
+                            "messages": [
+                                {"role": "system", "content": system_prompt},
+                                {"role": "user", "content": prompt}
+                            ],
+                            "temperature": 0.3,
+                            "max_tokens": 1000,
+                            "stream": True
+                        })
+                    ) as response:
+                        openai_limiter.on_headers(response.headers)
+                        rate_limiters["openai"].reconcile(response.headers)
+                        if response.status_code != 200:
+                            await response.aread()
+                        else:
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data: ") or line == "data: [DONE]":
+                                    continue
+                                for choice in orjson.loads(line[6:]).get("choices", []):
+                                    content += choice.get("delta", {}).get("content") or ""
+                                if on_tier and streamed is None:
+                                    tier = _TIER_RE.search(content)
+                                    if tier:
+                                        score = _SCORE_RE.search(content)
+                                        streamed = {"icp_score": int(score.group(1)) if score else 0, "tier": tier.group(1)}
+                                        on_tier(dict(streamed))
+                except httpx.TransportError:
+                    openai_limiter.on_error()
+                    # Don't retry once on_tier has fired, or the early alert would repeat
+                    if streamed or attempt == RETRY_ATTEMPTS - 1:
+                        raise
+                    transport_failed = True
+                else:
+                    if response.status_code == 200:
+                        openai_limiter.on_success(time.monotonic() - started)
+                    else:
+                        openai_limiter.on_error(response.status_code)
             
-            if response.status_code == 200:
-                content = response.json()["choices"][0]["message"]["content"]
-                content = content.replace("```json", "").replace("```", "").strip()
-                return {"success": True, "data": json.loads(content)}
-            return {"success": False, "error": response.text}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+            # Back off outside the limiter slots so waiting doesn't hold capacity
+            if transport_failed:
+                await asyncio.sleep(backoff_delay(attempt))
+            elif attempt == RETRY_ATTEMPTS - 1 or not is_retryable(response.status_code):
+                break
+            else:
+                await asyncio.sleep(backoff_delay(attempt, response.headers.get("retry-after", "")))
+        
+        if response.status_code == 200:
+            content = content.replace("```json", "").replace("```", "").strip()
+            data = orjson.loads(content)
+            await put_enrichment("score", cache_key, orjson.dumps(data))
+            return {"success": True, "data": data}
+        return {"success": False, "error": response.text}
+    except Exception as e:
+        if streamed:
+            print(f"⚠️ Scoring failed after the tier streamed ({e}), keeping {streamed['tier']}")
+            return {"success": True, "data": streamed, "partial": True}
+        return {"success": False, "error": str(e)}
+
+# ============== PIPELINE CONCURRENCY ==============
+
+# At most PIPELINE_CONCURRENCY enrichment pipelines run at once; a webhook spike queues
+# here instead of opening sockets to every upstream at the same time
+PIPELINE_CONCURRENCY = 64
+PIPELINE_SEM = asyncio.Semaphore(PIPELINE_CONCURRENCY)
+pipelines_waiting = 0
+
+def bounded_pipeline(func: Callable) -> Callable:
+    """Run the decorated pipeline under PIPELINE_SEM, logging the backlog when saturated"""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        global pipelines_waiting
+        if PIPELINE_SEM.locked():
+            print(f"⏳ Pipelines saturated, {pipelines_waiting + 1} waiting")
+        pipelines_waiting += 1
+        try:
+            await PIPELINE_SEM.acquire()
+        finally:
+            pipelines_waiting -= 1
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            PIPELINE_SEM.release()
+    return wrapper
 
 # ============== VISITOR PROCESSING ==============
 
-async def process_visitor(visitor: VisitorData, client_ip: str):
-    """Main processing pipeline for tracking script"""
-    settings = get_settings()
+async def process_visitor(clients: Dict[str, httpx.AsyncClient], visitor: VisitorData, client_ip: str):
+    """Entry point for tracking events: save the raw event, then debounce enrichment per session"""
     ip = visitor.ip_address or client_ip or ""
     
     print(f"📍 Processing: IP={ip}, Session={visitor.session_id}")
     
     # Save raw visitor
-    save_visitor(visitor, ip)
+    await save_visitor(visitor, ip)
     
-    # Skip local IPs
-    if not ip or ip in ["127.0.0.1", "::1", "localhost"]:
-        print("⚠️ Local IP, skipping enrichment")
+    if not ip:
+        print("⚠️ No IP, skipping enrichment")
         return
     
-    lead_id = f"lead_{int(datetime.now().timestamp())}_{visitor.session_id[:8]}"
+    buffer_session(clients, visitor, ip)
+
+# ============== SESSION DEBOUNCE ==============
+
+# A session is enriched once: after SESSION_IDLE_SECONDS without events, or on unload
+SESSION_IDLE_SECONDS = 10
+session_state: Dict[str, Dict] = {}
+pipeline_tasks: set = set()
+
+def _page_key(page: Any) -> bytes:
+    return orjson.dumps(page, option=orjson.OPT_SORT_KEYS)
+
+def buffer_session(clients: Dict[str, httpx.AsyncClient], visitor: VisitorData, ip: str):
+    """Merge this event into its session and (re)arm the idle timer"""
+    state = session_state.get(visitor.session_id)
+    if state:
+        state["timer"].cancel()
+        previous = state["visitor"]
+        seen = {_page_key(p) for p in previous.pages_viewed}
+        visitor.pages_viewed = previous.pages_viewed + [p for p in visitor.pages_viewed if _page_key(p) not in seen]
+        visitor.visit_duration = max(previous.visit_duration, visitor.visit_duration)
+        # The landing page's referrer is the external source; later events only refer to our own pages
+        visitor.referrer = previous.referrer or visitor.referrer
+    
+    timer = asyncio.get_running_loop().call_later(SESSION_IDLE_SECONDS, flush_session, visitor.session_id)
+    session_state[visitor.session_id] = {"clients": clients, "visitor": visitor, "ip": ip, "timer": timer}
+    if visitor.event == "unload":
+        flush_session(visitor.session_id)
+
+def flush_session(session_id: str):
+    """Run the enrichment pipeline once with the session's aggregated data"""
+    state = session_state.pop(session_id, None)
+    if not state:
+        return
+    state["timer"].cancel()
+    task = asyncio.create_task(enrich_visitor(state["clients"], state["visitor"], state["ip"]))
+    pipeline_tasks.add(task)
+    task.add_done_callback(pipeline_tasks.discard)
+
+async def flush_all_sessions():
+    """Shutdown: enrich every buffered session and wait for in-flight pipelines"""
+    for session_id in list(session_state):
+        flush_session(session_id)
+    if pipeline_tasks:
+        await asyncio.gather(*pipeline_tasks, return_exceptions=True)
+
+@bounded_pipeline
+async def enrich_visitor(clients: Dict[str, httpx.AsyncClient], visitor: VisitorData, ip: str):
+    """Main processing pipeline for tracking script"""
+    settings = get_settings()
+    lead_id = new_lead_id("lead", visitor.session_id[:8])
     
     # Step 1: IP Lookup
-    ip_result = await lookup_company_from_ip(ip, settings.get("ipinfo_token", ""))
+    ip_result = await lookup_company_from_ip(clients["ipinfo"], ip, settings.ipinfo_token)
     identified = ip_result.get("data", {}).get("company_name", "") if ip_result.get("success") else ""
     domain = ip_result.get("data", {}).get("domain", "") if ip_result.get("success") else ""
     
     print(f"🔍 IP Lookup: {identified} ({domain})")
     
-    # Step 2: Enrich with Apollo
+    # Step 2+3: Enrich with Apollo and find contacts with Hunter (independent, run concurrently)
     company = {"name": identified or "Unknown", "domain": domain, "industry": "Unknown", "employee_count": 0, "country": ip_result.get("data", {}).get("country", "")}
-    if domain and settings.get("apollo_api_key"):
-        result = await enrich_company_apollo(domain, settings["apollo_api_key"])
-        if result.get("success"):
-            company = result["data"]
-            print(f"✅ Apollo: {company.get('name')} - {company.get('industry')}")
-    
-    # Step 3: Find contacts
     contacts = []
-    if domain and settings.get("hunter_api_key"):
-        result = await find_contacts_hunter(domain, settings["hunter_api_key"])
-        if result.get("success"):
-            contacts = result["contacts"]
-            print(f"✅ Hunter: {len(contacts)} contacts")
+    apollo_result, hunter_result = await asyncio.gather(
+        enrich_company_apollo(clients["apollo"], domain, settings.apollo_api_key),
+        find_contacts_hunter(clients["hunter"], domain, settings.hunter_api_key)
+    )
+    if apollo_result.get("success"):
+        company = apollo_result["data"]
+        print(f"✅ Apollo: {company.get('name')} - {company.get('industry')}")
+    if hunter_result.get("success"):
+        contacts = hunter_result["contacts"]
+        print(f"✅ Hunter: {len(contacts)} contacts")
     
     # Step 4: AI Scoring
     scoring = {
@@ -419,26 +732,45 @@ async def process_visitor(visitor: VisitorData, client_ip: str):
         "research_summary": f"Visitor from {identified or ip}", "talking_points": [], "email_draft": {}
     }
     
-    if settings.get("openai_api_key") and identified:
+    # Hot leads alert Slack as soon as the streamed tier arrives, in parallel with the rest
+    early_alert = []
+    def on_tier(partial: Dict):
+        if partial.get("tier") == "hot" and settings.slack_webhook_url:
+            early_alert.append(asyncio.create_task(send_slack_alert(clients["slack"], company, partial, ip, {}, settings.slack_webhook_url)))
+    
+    if settings.openai_api_key and identified:
         visit_data = {"pages_viewed": visitor.pages_viewed, "visit_duration": visitor.visit_duration, "referrer": visitor.referrer}
         person_data = {}
-        result = await score_lead_openai(company, contacts, visit_data, person_data, settings["openai_api_key"], settings["icp_config"])
+        result = await score_lead_openai(clients["openai"], company, contacts, visit_data, person_data, settings.openai_api_key, settings.icp_config, on_tier)
         if result.get("success"):
-            scoring = result["data"]
+            # A partial result only carries icp_score/tier; keep the defaults for the rest
+            scoring = {**scoring, **result["data"]} if result.get("partial") else result["data"]
             print(f"✅ Score: {scoring.get('icp_score')}/100 ({scoring.get('tier')})")
     
     # Step 5: Save to database
-    save_lead(lead_id, company, contacts, visitor, scoring, ip, identified, "tracking", {})
+    await save_lead(lead_id, company, contacts, visitor, scoring, ip, identified, "tracking", {})
     
     # Step 6: Slack notification for hot leads
-    if settings.get("slack_webhook_url") and scoring.get("tier") == "hot":
-        await send_slack_alert(company, scoring, ip, {}, settings["slack_webhook_url"])
+    if early_alert:
+        await early_alert[0]
+    elif settings.slack_webhook_url and scoring.get("tier") == "hot":
+        await send_slack_alert(clients["slack"], company, scoring, ip, {}, settings.slack_webhook_url)
     
     print(f"✅ Lead saved: {lead_id}")
 
 # ============== RB2B PROCESSING ==============
 
-async def process_rb2b_lead(rb2b_data: dict):
+def apply_rb2b_bonus(scoring: Dict) -> Dict:
+    """RB2B leads get bonus points for having email"""
+    scoring["icp_score"] = min(100, scoring.get("icp_score", 50) + 15)
+    if scoring["icp_score"] >= 70:
+        scoring["tier"] = "hot"
+    elif scoring["icp_score"] >= 50:
+        scoring["tier"] = "warm"
+    return scoring
+
+@bounded_pipeline
+async def process_rb2b_lead(clients: Dict[str, httpx.AsyncClient], rb2b_data: dict):
     """Process lead from RB2B webhook - Person-level identification!"""
     settings = get_settings()
     
@@ -460,23 +792,21 @@ async def process_rb2b_lead(rb2b_data: dict):
     
     print(f"🎯 RB2B Lead: {full_name} ({email}) - {title} at {company_name}")
     
-    lead_id = f"rb2b_{int(datetime.now().timestamp())}_{email.split('@')[0][:8]}"
+    lead_id = new_lead_id("rb2b", email.split('@')[0][:8])
     
-    # Enrich company with Apollo
+    # Enrich company with Apollo and find more contacts concurrently
     company = {"name": company_name or domain, "domain": domain, "industry": "Unknown", "employee_count": 0, "country": ""}
-    if domain and settings.get("apollo_api_key"):
-        result = await enrich_company_apollo(domain, settings["apollo_api_key"])
-        if result.get("success"):
-            company = result["data"]
-            print(f"✅ Apollo: {company.get('name')} - {company.get('industry')}")
-    
-    # Find more contacts
     contacts = []
-    if domain and settings.get("hunter_api_key"):
-        result = await find_contacts_hunter(domain, settings["hunter_api_key"])
-        if result.get("success"):
-            contacts = result["contacts"]
-            print(f"✅ Hunter: {len(contacts)} more contacts")
+    apollo_result, hunter_result = await asyncio.gather(
+        enrich_company_apollo(clients["apollo"], domain, settings.apollo_api_key),
+        find_contacts_hunter(clients["hunter"], domain, settings.hunter_api_key)
+    )
+    if apollo_result.get("success"):
+        company = apollo_result["data"]
+        print(f"✅ Apollo: {company.get('name')} - {company.get('industry')}")
+    if hunter_result.get("success"):
+        contacts = hunter_result["contacts"]
+        print(f"✅ Hunter: {len(contacts)} more contacts")
     
     # Person data for scoring
     person_data = {
@@ -495,118 +825,194 @@ async def process_rb2b_lead(rb2b_data: dict):
         "email_draft": {"subject": f"Following up on your visit", "body": f"Hi {first_name}, I noticed you visited our website..."}
     }
     
-    if settings.get("openai_api_key"):
+    # The bonus only raises the score, so a streamed "hot" is already final
+    early_alert = []
+    def on_tier(partial: Dict):
+        apply_rb2b_bonus(partial)
+        if partial.get("tier") == "hot" and settings.slack_webhook_url:
+            early_alert.append(asyncio.create_task(send_slack_alert(clients["slack"], company, partial, "", person_data, settings.slack_webhook_url)))
+    
+    if settings.openai_api_key:
         visit_data = {"pages_viewed": [], "visit_duration": 0, "referrer": ""}
-        result = await score_lead_openai(company, contacts, visit_data, person_data, settings["openai_api_key"], settings["icp_config"])
+        result = await score_lead_openai(clients["openai"], company, contacts, visit_data, person_data, settings.openai_api_key, settings.icp_config, on_tier)
         if result.get("success"):
-            scoring = result["data"]
-            # RB2B leads get bonus points for having email
-            scoring["icp_score"] = min(100, scoring.get("icp_score", 50) + 15)
-            if scoring["icp_score"] >= 70:
-                scoring["tier"] = "hot"
-            elif scoring["icp_score"] >= 50:
-                scoring["tier"] = "warm"
+            scoring = apply_rb2b_bonus({**scoring, **result["data"]} if result.get("partial") else result["data"])
             print(f"✅ Score: {scoring.get('icp_score')}/100 ({scoring.get('tier')})")
     
     # Save to database
-    save_rb2b_lead(lead_id, company, contacts, scoring, person_data, rb2b_data)
+    await save_rb2b_lead(lead_id, company, contacts, scoring, person_data, rb2b_data)
     
     # Slack notification for hot leads
-    if settings.get("slack_webhook_url") and scoring.get("tier") == "hot":
-        await send_slack_alert(company, scoring, "", person_data, settings["slack_webhook_url"])
+    if early_alert:
+        await early_alert[0]
+    elif settings.slack_webhook_url and scoring.get("tier") == "hot":
+        await send_slack_alert(clients["slack"], company, scoring, "", person_data, settings.slack_webhook_url)
     
     print(f"🎉 RB2B Lead saved: {lead_id}")
     return {"lead_id": lead_id, "person": person_data, "company": company, "scoring": scoring}
 
-def save_rb2b_lead(lead_id: str, company: Dict, contacts: List, scoring: Dict, person: Dict, raw_data: Dict):
-    """Save RB2B lead to database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Save/update company
-    company_id = None
-    if company.get("domain"):
-        cursor.execute("""
-            INSERT OR REPLACE INTO companies (domain, name, industry, employee_count, country, city, description, funding_stage, total_funding, linkedin_url, enriched_data)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (company.get("domain"), company.get("name"), company.get("industry"), company.get("employee_count", 0),
-              company.get("country"), company.get("city"), company.get("description"), company.get("funding_stage"),
-              company.get("total_funding", 0), company.get("linkedin_url"), json.dumps(company)))
-        cursor.execute("SELECT id FROM companies WHERE domain=?", (company["domain"],))
-        row = cursor.fetchone()
-        if row:
-            company_id = row[0]
-        
-        # Save contacts
-        for c in contacts:
-            cursor.execute("""
-                INSERT OR IGNORE INTO contacts (company_id, name, email, title, seniority, department, linkedin_url, confidence)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (company_id, c.get("name"), c.get("email"), c.get("title"), c.get("seniority"), c.get("department"), c.get("linkedin_url"), c.get("confidence", 0)))
-    
-    # Save lead with person data
-    cursor.execute("""
-        INSERT INTO leads (lead_id, company_id, session_id, ip_address, identified_company, pages_viewed, visit_duration, referrer, 
-                          icp_score, tier, match_reasons, intent_signals, research_summary, talking_points, email_draft, 
-                          recommended_action, urgency, source, person_name, person_email, person_title, person_linkedin)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (lead_id, company_id, "", "", company.get("name", ""), json.dumps([]), 0, "",
-          scoring.get("icp_score", 0), scoring.get("tier", "warm"), json.dumps(scoring.get("match_reasons", [])),
-          json.dumps(scoring.get("intent_signals", [])), scoring.get("research_summary", ""), json.dumps(scoring.get("talking_points", [])),
-          json.dumps(scoring.get("email_draft", {})), scoring.get("recommended_action", "send_email"), scoring.get("urgency", "medium"),
-          "rb2b", person.get("name", ""), person.get("email", ""), person.get("title", ""), person.get("linkedin", "")))
-    
-    conn.commit()
-    conn.close()
+def company_row(company: Dict) -> tuple:
+    return (company.get("domain"), company.get("name"), company.get("industry"), company.get("employee_count", 0),
+            company.get("country"), company.get("city"), company.get("description"), company.get("funding_stage"),
+            company.get("total_funding", 0), company.get("linkedin_url"), to_json(company))
 
-def save_visitor(visitor: VisitorData, ip: str):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO visitors (session_id, ip_address, pages_viewed, visit_duration, referrer, user_agent)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (visitor.session_id, ip, json.dumps(visitor.pages_viewed), visitor.visit_duration, visitor.referrer, visitor.user_agent))
-    conn.commit()
-    conn.close()
+def contact_rows(contacts: List) -> List[tuple]:
+    return [(c.get("name"), c.get("email"), c.get("title"), c.get("seniority"), c.get("department"), c.get("linkedin_url"), c.get("confidence", 0))
+            for c in contacts]
 
-def save_lead(lead_id: str, company: Dict, contacts: List, visitor: VisitorData, scoring: Dict, ip: str, identified: str, source: str, person: Dict):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Save company
-    company_id = None
-    if company.get("domain"):
-        cursor.execute("""
-            INSERT OR REPLACE INTO companies (domain, name, industry, employee_count, country, city, description, funding_stage, total_funding, linkedin_url, enriched_data)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (company.get("domain"), company.get("name"), company.get("industry"), company.get("employee_count", 0),
-              company.get("country"), company.get("city"), company.get("description"), company.get("funding_stage"),
-              company.get("total_funding", 0), company.get("linkedin_url"), json.dumps(company)))
-        company_id = cursor.lastrowid or cursor.execute("SELECT id FROM companies WHERE domain=?", (company["domain"],)).fetchone()[0]
+def new_lead_id(prefix: str, tag: str = "") -> str:
+    """<prefix>_<unix ts>[_<tag>]_<random hex>; the random suffix keeps same-second leads distinct"""
+    parts = [prefix, str(int(datetime.now().timestamp()))] + ([tag] if tag else []) + [secrets.token_hex(4)]
+    return "_".join(parts)
+
+async def save_rb2b_lead(lead_id: str, company: Dict, contacts: List, scoring: Dict, person: Dict, raw_data: Dict):
+    """Queue RB2B lead for the batched DB writer"""
+    # company_id (index 1) is resolved by the writer once the company row exists
+    lead = (lead_id, None, "", "", company.get("name", ""), to_msgpack([]), 0, "",
+            scoring.get("icp_score", 0), scoring.get("tier", "warm"), to_msgpack(scoring.get("match_reasons", [])),
+            to_msgpack(scoring.get("intent_signals", [])), scoring.get("research_summary", ""), to_msgpack(scoring.get("talking_points", [])),
+            to_msgpack(scoring.get("email_draft", {})), scoring.get("recommended_action", "send_email"), scoring.get("urgency", "medium"),
+            "rb2b", person.get("name", ""), person.get("email", ""), person.get("title", ""), person.get("linkedin", ""))
+    has_company = bool(company.get("domain"))
+    await app.state.db_queue.put(("leads", (company_row(company) if has_company else None, contact_rows(contacts) if has_company else [], lead)))
+
+async def save_visitor(visitor: VisitorData, ip: str):
+    await app.state.db_queue.put(("visitors", (visitor.session_id, ip, to_json(visitor.pages_viewed), visitor.visit_duration, visitor.referrer, visitor.user_agent)))
+
+async def save_lead(lead_id: str, company: Dict, contacts: List, visitor: VisitorData, scoring: Dict, ip: str, identified: str, source: str, person: Dict):
+    lead = (lead_id, None, visitor.session_id, ip, identified, to_msgpack(visitor.pages_viewed), visitor.visit_duration, visitor.referrer,
+            scoring.get("icp_score", 0), scoring.get("tier", "cold"), to_msgpack(scoring.get("match_reasons", [])),
+            to_msgpack(scoring.get("intent_signals", [])), scoring.get("research_summary", ""), to_msgpack(scoring.get("talking_points", [])),
+            to_msgpack(scoring.get("email_draft", {})), scoring.get("recommended_action", ""), scoring.get("urgency", "low"),
+            source, person.get("name", ""), person.get("email", ""), person.get("title", ""), person.get("linkedin", ""))
+    has_company = bool(company.get("domain"))
+    await app.state.db_queue.put(("leads", (company_row(company) if has_company else None, contact_rows(contacts) if has_company else [], lead)))
+
+# ============== BATCHED DB WRITER ==============
+
+DB_FLUSH_ROWS = 50
+DB_FLUSH_INTERVAL = 0.2  # seconds
+
+# Fixed SQL text so sqlite3's per-connection statement cache reuses the prepared statements
+SQL_INSERT_VISITOR = """
+    INSERT INTO visitors (session_id, ip_address, pages_viewed, visit_duration, referrer, user_agent)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+# ON CONFLICT updates in place: OR REPLACE would delete the row and hand out a new id,
+# orphaning contacts/leads that reference the old one
+SQL_UPSERT_COMPANY = """
+    INSERT INTO companies (domain, name, industry, employee_count, country, city, description, funding_stage, total_funding, linkedin_url, enriched_data)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(domain) DO UPDATE SET
+        name = excluded.name, industry = excluded.industry, employee_count = excluded.employee_count,
+        country = excluded.country, city = excluded.city, description = excluded.description,
+        funding_stage = excluded.funding_stage, total_funding = excluded.total_funding,
+        linkedin_url = excluded.linkedin_url, enriched_data = excluded.enriched_data
+    RETURNING id
+"""
+SQL_INSERT_CONTACT = """
+    INSERT OR IGNORE INTO contacts (company_id, name, email, title, seniority, department, linkedin_url, confidence)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+# OR IGNORE: one duplicate lead_id must not roll back the whole batch
+SQL_INSERT_LEAD = """
+    INSERT OR IGNORE INTO leads (lead_id, company_id, session_id, ip_address, identified_company, pages_viewed, visit_duration, referrer, 
+                      icp_score, tier, match_reasons, intent_signals, research_summary, talking_points, email_draft, 
+                      recommended_action, urgency, source, person_name, person_email, person_title, person_linkedin)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+SQL_UPSERT_ENRICHMENT = "INSERT OR REPLACE INTO enrichment_cache (kind, key, value, created_at) VALUES (?, ?, ?, ?)"
+SQL_SELECT_ENRICHMENT = "SELECT value, created_at FROM enrichment_cache WHERE kind = ? AND key = ? AND created_at > ?"
+SQL_PRUNE_ENRICHMENT = "DELETE FROM enrichment_cache WHERE kind = ? AND created_at < ?"
+
+# How often the writer deletes expired enrichment_cache rows (also done once in init_db)
+ENRICHMENT_PRUNE_INTERVAL = 3600  # seconds
+
+async def prune_enrichment_cache(db: aiosqlite.Connection):
+    """Delete enrichment_cache rows older than their kind's TTL"""
+    now = time.time()
+    try:
+        for kind, cache in ENRICHMENT_CACHES.items():
+            await db.execute(SQL_PRUNE_ENRICHMENT, (kind, now - cache.ttl))
+        await db.commit()
+    except sqlite3.Error as e:
+        await db.rollback()
+        print(f"❌ Enrichment cache prune failed: {e}")
+
+async def write_batch(db: aiosqlite.Connection, batch: List[tuple]):
+    """Write queued visitors/leads/enrichment cache rows in one transaction using executemany per table"""
+    visitors = [row for table, row in batch if table == "visitors"]
+    leads = [row for table, row in batch if table == "leads"]
+    enrichments = [row for table, row in batch if table == "enrichment_cache"]
+    companies = [company for company, _, _ in leads if company]
+    try:
+        if visitors:
+            await db.executemany(SQL_INSERT_VISITOR, visitors)
+        company_ids = {}
+        for company in companies:
+            async with db.execute(SQL_UPSERT_COMPANY, company) as cursor:
+                company_ids[company[0]] = (await cursor.fetchone())[0]
         
-        # Save contacts
-        for c in contacts:
-            cursor.execute("""
-                INSERT OR IGNORE INTO contacts (company_id, name, email, title, seniority, department, linkedin_url, confidence)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (company_id, c.get("name"), c.get("email"), c.get("title"), c.get("seniority"), c.get("department"), c.get("linkedin_url"), c.get("confidence", 0)))
-    
-    # Save lead
-    cursor.execute("""
-        INSERT INTO leads (lead_id, company_id, session_id, ip_address, identified_company, pages_viewed, visit_duration, referrer, 
-                          icp_score, tier, match_reasons, intent_signals, research_summary, talking_points, email_draft, 
-                          recommended_action, urgency, source, person_name, person_email, person_title, person_linkedin)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (lead_id, company_id, visitor.session_id, ip, identified, json.dumps(visitor.pages_viewed), visitor.visit_duration, visitor.referrer,
-          scoring.get("icp_score", 0), scoring.get("tier", "cold"), json.dumps(scoring.get("match_reasons", [])),
-          json.dumps(scoring.get("intent_signals", [])), scoring.get("research_summary", ""), json.dumps(scoring.get("talking_points", [])),
-          json.dumps(scoring.get("email_draft", {})), scoring.get("recommended_action", ""), scoring.get("urgency", "low"),
-          source, person.get("name", ""), person.get("email", ""), person.get("title", ""), person.get("linkedin", "")))
-    
-    conn.commit()
-    conn.close()
+        contacts, lead_rows = [], []
+        for company, company_contacts, lead in leads:
+            company_id = company_ids[company[0]] if company else None
+            contacts.extend((company_id,) + c for c in company_contacts)
+            lead_rows.append((lead[0], company_id) + lead[2:])
+        if contacts:
+            await db.executemany(SQL_INSERT_CONTACT, contacts)
+        # Row by row so a duplicate lead_id is ignored without failing the batch, yet still reported
+        dropped = []
+        for row in lead_rows:
+            async with db.execute(SQL_INSERT_LEAD, row) as cursor:
+                if cursor.rowcount == 0:
+                    dropped.append(row[0])
+        if dropped:
+            print(f"⚠️ Dropped {len(dropped)} lead(s) with duplicate lead_id: {', '.join(dropped)}")
+        if enrichments:
+            await db.executemany(SQL_UPSERT_ENRICHMENT, enrichments)
+        await db.commit()
+        if lead_rows:
+            invalidate_stats()
+    except Exception as e:
+        # Any error (not just sqlite3.Error) drops only this batch; letting it escape would end db_writer
+        await db.rollback()
+        print(f"❌ DB batch write failed ({len(batch)} rows): {e}")
+
+async def db_writer(queue: asyncio.Queue, db: aiosqlite.Connection):
+    """Drain the write queue, flushing every DB_FLUSH_ROWS rows or DB_FLUSH_INTERVAL seconds.
 
-async def send_slack_alert(company: Dict, scoring: Dict, ip: str, person: Dict, webhook_url: str):
+    A None item is the shutdown sentinel: the pending batch is written and the task returns.
+    (A sentinel rather than task.cancel(), which wait_for can swallow on Python 3.11.)
+    """
+    loop = asyncio.get_running_loop()
+    next_prune = loop.time() + ENRICHMENT_PRUNE_INTERVAL
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        batch = [item]
+        stop = False
+        deadline = loop.time() + DB_FLUSH_INTERVAL
+        while len(batch) < DB_FLUSH_ROWS:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        await write_batch(db, batch)
+        if loop.time() >= next_prune:
+            await prune_enrichment_cache(db)
+            next_prune = loop.time() + ENRICHMENT_PRUNE_INTERVAL
+        if stop:
+            return
+
+async def send_slack_alert(client: httpx.AsyncClient, company: Dict, scoring: Dict, ip: str, person: Dict, webhook_url: str):
     """Send Slack notification for hot leads"""
     person_info = ""
     if person.get("name"):
@@ -615,22 +1021,20 @@ async def send_slack_alert(company: Dict, scoring: Dict, ip: str, person: Dict,
     message = {
         "blocks": [
             {"type": "header", "text": {"type": "plain_text", "text": f"🔥 HOT LEAD: {company.get('name', 'Unknown')}"}},
-            {"type": "section", "text": {"type": "mrkdwn", "text": f"*Score:* {scoring.get('icp_score', 0)}/100 | *Industry:* {company.get('industry', 'Unknown')}{person_info}"}},
-            {"type": "section", "text": {"type": "mrkdwn", "text": f"*Summary:* {scoring.get('research_summary', '')}"}}
+            {"type": "section", "text": {"type": "mrkdwn", "text": f"*Score:* {scoring.get('icp_score', 0)}/100 | *Industry:* {company.get('industry', 'Unknown')}{person_info}"}}
         ]
     }
-    async with httpx.AsyncClient() as client:
-        try:
-            await client.post(webhook_url, json=message)
-        except:
-            pass
+    # Early (streamed) alerts are sent before the summary has been generated
+    if scoring.get("research_summary"):
+        message["blocks"].append({"type": "section", "text": {"type": "mrkdwn", "text": f"*Summary:* {scoring['research_summary']}"}})
+    try:
+        await request_with_retry(client, "POST", webhook_url, limiter=rate_limiters["slack"],
+                                 headers={"Content-Type": "application/json"}, content=orjson.dumps(message))
+    except:
+        pass
 
 # ============== API ENDPOINTS ==============
 
-@app.on_event("startup")
-async def startup():
-    init_db()
-
 @app.get("/")
 async def root():
     return {"message": "Swan AI Clone API with RB2B", "version": "2.1", "status": "running"}
@@ -645,12 +1049,12 @@ async def health():
 async def rb2b_webhook(request: Request, background_tasks: BackgroundTasks):
     """Receive visitor data from RB2B webhook"""
     try:
-        body = await request.json()
+        body = orjson.loads(await request.body())
         print(f"📡 RB2B Webhook received!")
-        print(f"📦 Data: {json.dumps(body, indent=2)}")
+        print(f"📦 Data: {orjson.dumps(body, option=orjson.OPT_INDENT_2).decode()}")
         
         # Process in background
-        background_tasks.add_task(process_rb2b_lead, body)
+        background_tasks.add_task(process_rb2b_lead, request.app.state.http, body)
         
         return {"status": "received", "message": "Processing RB2B lead"}
     except Exception as e:
@@ -659,6 +1063,15 @@ async def rb2b_webhook(request: Request, background_tasks: BackgroundTasks):
 
 # ============== TRACKING WEBHOOK ==============
 
+# Traffic rejected in the handler, before anything is written or scheduled
+LOCAL_IPS = frozenset({"127.0.0.1", "::1", "localhost"})
+_BOT_RE = re.compile(r"bot|crawler|spider|curl|wget|headless", re.I)
+# Repeats of the same (session, url, event) within a few seconds are bounce/reload floods
+recent_events = TTLCache(maxsize=50_000, ttl=5)
+
+def is_bot(user_agent: Optional[str]) -> bool:
+    return bool(user_agent) and _BOT_RE.search(user_agent) is not None
+
 @app.post("/webhook/visitor")
 async def receive_visitor(request: Request, visitor: VisitorData, background_tasks: BackgroundTasks):
     """Receive tracking data from website"""
@@ -669,15 +1082,22 @@ async def receive_visitor(request: Request, visitor: VisitorData, background_tas
     if not client_ip:
         client_ip = request.client.host if request.client else ""
     
+    if is_bot(visitor.user_agent) or (visitor.ip_address or client_ip) in LOCAL_IPS:
+        return {"status": "ignored"}
+    event_key = (visitor.session_id, visitor.current_url, visitor.event)
+    if recent_events.get(event_key):
+        return {"status": "ignored"}
+    recent_events.set(event_key, True)
+    
     print(f"🌐 Webhook: IP={client_ip}, Session={visitor.session_id}, Event={visitor.event}")
     
     # Process in background
-    background_tasks.add_task(process_visitor, visitor, client_ip)
+    background_tasks.add_task(process_visitor, request.app.state.http, visitor, client_ip)
     
     return {"status": "received", "ip": client_ip}
 
 @app.post("/api/test-rb2b")
-async def test_rb2b():
+async def test_rb2b(request: Request):
     """Test RB2B processing with sample data"""
     sample_data = {
         "First Name": "John",
@@ -687,162 +1107,254 @@ async def test_rb2b():
         "Company": "Shopify",
         "LinkedIn URL": "https://www.linkedin.com/in/johnsmith/"
     }
-    result = await process_rb2b_lead(sample_data)
+    result = await process_rb2b_lead(request.app.state.http, sample_data)
     return {"status": "success", "result": result}
 
 @app.post("/api/test-visitor")
-async def test_visitor(domain: str = "notion.so"):
+async def test_visitor(request: Request, domain: str = "notion.so"):
     """Test with a specific domain"""
     settings = get_settings()
-    lead_id = f"test_{int(datetime.now().timestamp())}"
+    clients = request.app.state.http
+    lead_id = new_lead_id("test")
     
-    # Enrich
+    # Enrich + contacts
     company = {"name": domain.split(".")[0].title(), "domain": domain, "industry": "Unknown", "employee_count": 0}
-    if settings.get("apollo_api_key"):
-        result = await enrich_company_apollo(domain, settings["apollo_api_key"])
-        if result.get("success"):
-            company = result["data"]
-    
-    # Contacts
-    contacts = []
-    if settings.get("hunter_api_key"):
-        result = await find_contacts_hunter(domain, settings["hunter_api_key"])
-        contacts = result.get("contacts", [])
+    apollo_result, hunter_result = await asyncio.gather(
+        enrich_company_apollo(clients["apollo"], domain, settings.apollo_api_key),
+        find_contacts_hunter(clients["hunter"], domain, settings.hunter_api_key)
+    )
+    if apollo_result.get("success"):
+        company = apollo_result["data"]
+    contacts = hunter_result.get("contacts", [])
     
     # Score
     scoring = {"icp_score": 50, "tier": "warm", "match_reasons": [], "intent_signals": [], "research_summary": "Test lead", "talking_points": [], "email_draft": {}}
-    if settings.get("openai_api_key"):
+    if settings.openai_api_key:
         visit_data = {"pages_viewed": ["/", "/pricing"], "visit_duration": 120, "referrer": ""}
-        result = await score_lead_openai(company, contacts, visit_data, {}, settings["openai_api_key"], settings["icp_config"])
+        result = await score_lead_openai(clients["openai"], company, contacts, visit_data, {}, settings.openai_api_key, settings.icp_config)
         if result.get("success"):
             scoring = result["data"]
     
     return {"lead_id": lead_id, "company": company, "contacts": contacts, "scoring": scoring}
 
-@app.get("/api/leads")
-async def get_leads(limit: int = 50, tier: Optional[str] = None, source: Optional[str] = None):
-    """Get all leads"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+_loads = orjson.loads
+LEAD_PACKED_COLUMNS = ('pages_viewed', 'match_reasons', 'intent_signals', 'talking_points', 'email_draft')
+
+def unpack_column(value: Any) -> Any:
+    """Decode a packed lead column: MessagePack bytes, or JSON text from rows written before the switch"""
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        return msgpack.unpackb(value)
+    return _loads(value)
+
+def unpack_lead_columns(lead: Dict) -> Dict:
+    """Decode the lead's structured columns in place"""
+    for f in LEAD_PACKED_COLUMNS:
+        lead[f] = unpack_column(lead.get(f))
+    return lead
+
+def _where(terms: List[str]) -> str:
+    return "WHERE " + " AND ".join(terms) if terms else ""
+
+def _lead_filters(tier: bool, source: bool) -> List[str]:
+    """WHERE terms for the given filters, numbered ?1, ?2 in (tier, source) order"""
+    filters = []
+    for column, given in (("l.tier", tier), ("l.source", source)):
+        if given:
+            filters.append(f"{column} = ?{len(filters) + 1}")
+    return filters
+
+def _list_leads_sql(tier: bool, source: bool, after: bool) -> str:
+    # Numbered parameters: filters first, then the keyset (created_at, id), then LIMIT
+    filters = _lead_filters(tier, source)
+    n = len(filters)
+    page = filters + ([f"(l.created_at, l.id) < (?{n + 1}, ?{n + 2})"] if after else [])
+    n += 2 if after else 0
+    # total_count is an uncorrelated subquery over the filters only: SQLite runs it once per
+    # statement, and unlike COUNT(*) OVER () it leaves ORDER BY ... LIMIT free to walk an index
+    return f"""
+    SELECT l.*, c.name as company_name, c.domain, c.industry, c.employee_count, c.country, c.funding_stage,
+        (SELECT COUNT(*) FROM leads l {_where(filters)}) AS total_count
+    FROM leads l LEFT JOIN companies c ON l.company_id = c.id {_where(page)}
+    ORDER BY l.created_at DESC, l.id DESC LIMIT ?{n + 1}"""
+
+# One fixed statement per (tier given, source given, cursor given) so the statement cache always hits
+SQL_LIST_LEADS = {key: _list_leads_sql(*key) for key in product((False, True), repeat=3)}
+# For an empty page, where no row carries total_count
+SQL_COUNT_LEADS = {key: f"SELECT COUNT(*) FROM leads l {_where(_lead_filters(*key))}" for key in product((False, True), repeat=2)}
+
+SQL_LIST_VISITORS = {
+    False: "SELECT * FROM visitors ORDER BY created_at DESC, id DESC LIMIT ?",
+    True: "SELECT * FROM visitors WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?",
+}
+
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(created_at: str, row_id: int) -> str:
+    """Opaque keyset cursor for the row a page ended on"""
+    return base64.urlsafe_b64encode(orjson.dumps([created_at, row_id])).decode()
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        created_at, row_id = orjson.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(row_id, int) or isinstance(row_id, bool):
+        raise HTTPException(400, "Invalid cursor")
+    return [created_at, row_id]
+
+def db(request: Request):
+    """Dependency: borrow a pooled read connection for the duration of the request"""
+    with request.app.state.read_pool.connection() as conn:
+        yield conn
+
+# The read endpoints stay async but run their sqlite3 work through asyncio.to_thread
+# (_sync_* helpers), so a slow query never blocks the event loop; pooled connections
+# are check_same_thread=False and only ever used by one request at a time.
+
+def _sync_get_leads(conn: sqlite3.Connection, limit: int, tier: Optional[str], source: Optional[str], after: list) -> Dict:
+    cur = conn.cursor()
+    cur.row_factory = None  # plain tuples; columns are zipped in below
     
-    query = """
-        SELECT l.*, c.name as company_name, c.domain, c.industry, c.employee_count, c.country, c.funding_stage
-        FROM leads l LEFT JOIN companies c ON l.company_id = c.id WHERE 1=1
-    """
-    params = []
-    if tier:
-        query += " AND l.tier = ?"
-        params.append(tier)
-    if source:
-        query += " AND l.source = ?"
-        params.append(source)
-    query += " ORDER BY l.created_at DESC LIMIT ?"
-    params.append(limit)
-    
-    cursor.execute(query, params)
-    leads = []
-    for row in cursor.fetchall():
-        lead = dict(row)
-        for f in ['pages_viewed', 'match_reasons', 'intent_signals', 'talking_points', 'email_draft']:
-            if lead.get(f):
-                try:
-                    lead[f] = json.loads(lead[f])
-                except:
-                    pass
-        leads.append(lead)
+    filter_params = [value for value in (tier, source) if value]
+    # One extra row tells us whether another page exists
+    cur.execute(SQL_LIST_LEADS[bool(tier), bool(source), bool(after)], filter_params + after + [limit + 1])
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cols = [d[0] for d in cur.description]
+    packed_idx = [(cols.index(f), f) for f in LEAD_PACKED_COLUMNS]
+    cols.pop()
+    if rows:
+        total = rows[0][-1]
+    else:
+        total = cur.execute(SQL_COUNT_LEADS[bool(tier), bool(source)], filter_params).fetchone()[0]
     
-    conn.close()
-    return {"leads": leads, "total": len(leads)}
-
-@app.get("/api/leads/{lead_id}")
-async def get_lead(lead_id: str):
-    """Get single lead with contacts"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    leads = [{**dict(zip(cols, r[:-1])), **{f: unpack_column(r[i]) for i, f in packed_idx}} for r in rows]
+    next_cursor = encode_cursor(leads[-1]["created_at"], leads[-1]["id"]) if has_more and leads else None
     
-    cursor.execute("""
-        SELECT l.*, c.name as company_name, c.domain, c.industry, c.employee_count, c.country, c.city, c.description, c.funding_stage, c.total_funding, c.linkedin_url
-        FROM leads l LEFT JOIN companies c ON l.company_id = c.id WHERE l.lead_id = ?
-    """, (lead_id,))
-    row = cursor.fetchone()
+    return {"leads": leads, "total": total, "next_cursor": next_cursor}
+
+@app.get("/api/leads")
+async def get_leads(limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE), tier: Optional[str] = None, source: Optional[str] = None,
+                    cursor: Optional[str] = None, conn: sqlite3.Connection = Depends(db)):
+    """Get leads newest first; pass next_cursor back as cursor for the following page"""
+    after = decode_cursor(cursor) if cursor else []
+    return await asyncio.to_thread(_sync_get_leads, conn, limit, tier, source, after)
+
+# Lead, company and its contacts in one statement; contacts come back as a JSON array
+SQL_GET_LEAD = """
+    SELECT l.*, c.name as company_name, c.domain, c.industry, c.employee_count, c.country, c.city, c.description, c.funding_stage, c.total_funding, c.linkedin_url,
+        (SELECT json_group_array(json_object(
+            'id', ct.id, 'company_id', ct.company_id, 'name', ct.name, 'email', ct.email, 'title', ct.title,
+            'seniority', ct.seniority, 'department', ct.department, 'linkedin_url', ct.linkedin_url, 'confidence', ct.confidence))
+         FROM contacts ct WHERE ct.company_id = l.company_id) AS contacts_json
+    FROM leads l LEFT JOIN companies c ON l.company_id = c.id WHERE l.lead_id = ?
+"""
+
+def _sync_get_lead(conn: sqlite3.Connection, lead_id: str) -> Optional[Dict]:
+    row = conn.execute(SQL_GET_LEAD, (lead_id,)).fetchone()
     if not row:
-        raise HTTPException(404, "Lead not found")
+        return None
     
     lead = dict(row)
-    for f in ['pages_viewed', 'match_reasons', 'intent_signals', 'talking_points', 'email_draft']:
-        if lead.get(f):
-            try:
-                lead[f] = json.loads(lead[f])
-            except:
-                pass
-    
-    cursor.execute("SELECT * FROM contacts WHERE company_id = ?", (lead.get("company_id"),))
-    lead["contacts"] = [dict(r) for r in cursor.fetchall()]
-    
-    conn.close()
+    unpack_lead_columns(lead)
+    lead["contacts"] = _loads(lead.pop("contacts_json"))
+    return lead
+
+@app.get("/api/leads/{lead_id}")
+async def get_lead(lead_id: str, conn: sqlite3.Connection = Depends(db)):
+    """Get single lead with contacts"""
+    lead = await asyncio.to_thread(_sync_get_lead, conn, lead_id)
+    if lead is None:
+        raise HTTPException(404, "Lead not found")
     return lead
 
+def _sync_delete_lead(conn: sqlite3.Connection, lead_id: str) -> int:
+    # Only the lead row: its company and contacts can be shared with other leads
+    with conn:
+        return conn.execute("DELETE FROM leads WHERE lead_id = ?", (lead_id,)).rowcount
+
 @app.delete("/api/leads/{lead_id}")
-async def delete_lead(lead_id: str):
-    conn = sqlite3.connect(DB_PATH)
-    conn.cursor().execute("DELETE FROM leads WHERE lead_id = ?", (lead_id,))
-    conn.commit()
-    conn.close()
+async def delete_lead(lead_id: str, conn: sqlite3.Connection = Depends(db)):
+    if await asyncio.to_thread(_sync_delete_lead, conn, lead_id) == 0:
+        raise HTTPException(404, "Lead not found")
+    invalidate_stats()
     return {"status": "deleted"}
 
+# Dashboards poll /api/stats; serve it from memory for a few seconds. Lead writes and deletes
+# clear it, new visitors only show up once it expires.
+STATS_CACHE_TTL = 5.0
+stats_cache = TTLCache(maxsize=1, ttl=STATS_CACHE_TTL)
+# Bumped by every invalidation; a query that started before one must not cache its result
+stats_generation = 0
+
+def invalidate_stats():
+    global stats_generation
+    stats_generation += 1
+    stats_cache.clear()
+
+SQL_LEAD_STATS = """
+    SELECT
+        COUNT(*) AS total_leads,
+        SUM(tier = 'hot') AS hot_leads,
+        SUM(tier = 'warm') AS warm_leads,
+        SUM(tier = 'cold') AS cold_leads,
+        AVG(icp_score) AS avg_score,
+        SUM(source = 'rb2b') AS rb2b_leads
+    FROM leads
+"""
+
+def _sync_get_stats(pool: ConnectionPool) -> Dict:
+    with pool.connection() as conn:
+        # One pass over leads for every counter instead of a scan per COUNT
+        row = conn.execute(SQL_LEAD_STATS).fetchone()
+        total_visits = conn.execute("SELECT COUNT(*) FROM visitors").fetchone()[0]
+    stats = {
+        "total_leads": row["total_leads"],
+        "hot_leads": row["hot_leads"] or 0,
+        "warm_leads": row["warm_leads"] or 0,
+        "cold_leads": row["cold_leads"] or 0,
+        "avg_score": round(row["avg_score"] or 0, 1),
+    }
+    stats["total_visits"] = total_visits
+    stats["rb2b_leads"] = row["rb2b_leads"] or 0
+    return stats
+
 @app.get("/api/stats")
-async def get_stats():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    stats = {}
-    cursor.execute("SELECT COUNT(*) FROM leads")
-    stats["total_leads"] = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM leads WHERE tier='hot'")
-    stats["hot_leads"] = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM leads WHERE tier='warm'")
-    stats["warm_leads"] = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM leads WHERE tier='cold'")
-    stats["cold_leads"] = cursor.fetchone()[0]
-    cursor.execute("SELECT AVG(icp_score) FROM leads")
-    stats["avg_score"] = round(cursor.fetchone()[0] or 0, 1)
-    cursor.execute("SELECT COUNT(*) FROM visitors")
-    stats["total_visits"] = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM leads WHERE source='rb2b'")
-    stats["rb2b_leads"] = cursor.fetchone()[0]
-    
-    conn.close()
+async def get_stats(request: Request):
+    # Checked before borrowing a connection, so a hit never waits on the pool. The cache
+    # is only touched here on the event loop, never from the worker thread.
+    cached = stats_cache.get("stats")
+    if cached is not None:
+        return cached
+    generation = stats_generation
+    stats = await asyncio.to_thread(_sync_get_stats, request.app.state.read_pool)
+    if generation == stats_generation:
+        stats_cache.set("stats", stats)
     return stats
 
+def _sync_get_visitors(conn: sqlite3.Connection, limit: int, after: list) -> Dict:
+    visitors = [dict(r) for r in conn.execute(SQL_LIST_VISITORS[bool(after)], after + [limit + 1])]
+    has_more = len(visitors) > limit
+    visitors = visitors[:limit]
+    next_cursor = encode_cursor(visitors[-1]["created_at"], visitors[-1]["id"]) if has_more and visitors else None
+    return {"visitors": visitors, "next_cursor": next_cursor}
+
 @app.get("/api/visitors")
-async def get_visitors(limit: int = 20):
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM visitors ORDER BY created_at DESC LIMIT ?", (limit,))
-    visitors = [dict(r) for r in cursor.fetchall()]
-    conn.close()
-    return {"visitors": visitors}
+async def get_visitors(limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, conn: sqlite3.Connection = Depends(db)):
+    after = decode_cursor(cursor) if cursor else []
+    return await asyncio.to_thread(_sync_get_visitors, conn, limit, after)
 
 # Simple dashboard redirect
-@app.get("/dashboard", response_class=HTMLResponse)
+DASHBOARD_URL = "https://swanclone1-git-main-dlmavs-projects.vercel.app"
+
+@app.get("/dashboard")
 async def dashboard():
-    return """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Swan AI - Dashboard</title>
-        <meta http-equiv="refresh" content="0;url=https://swanclone1-git-main-dlmavs-projects.vercel.app">
-    </head>
-    <body>
-        <p>Redirecting to dashboard...</p>
-    </body>
-    </html>
-    """
+    return RedirectResponse(DASHBOARD_URL, status_code=307)
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(app, host="0.0.0.0", port=port, loop="uvloop", http="httptools")